@@ -0,0 +1,208 @@
+"""End-to-end benchmark of the automation against the local mock PCT server.
+
+Generates synthetic answer CSVs, starts mock_pct_server.py, runs main.py once
+per configuration as a subprocess and reports files/hour, per-step latency
+percentiles (from --metrics_jsonl) and peak memory of the run's process tree.
+
+    python benchmark.py --files 20 --latency 0.05 --popup_rate 0.2
+    python benchmark.py --config "batched=--batched --workers 2" --output bench.json
+    python benchmark.py --baseline bench.json --tolerance 0.15
+
+With --baseline the run exits non-zero when throughput drops, or a step's p90
+latency or the peak memory grows, by more than --tolerance.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from main import option_mapping, pct_statements, process_tree_rss
+from mock_pct_server import start_mock_server
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+default_configs = {
+    "selenium": "",
+    "selenium-batched": "--batched",
+    "http": "--engine http",
+}
+
+
+def generate_csv_files(input_dir, count, seed=0):
+    """Writes count CSVs answering every statement with a seeded random opinion."""
+    rng = random.Random(seed)
+    opinions = list(option_mapping)
+    for i in range(count):
+        with open(os.path.join(input_dir, f"bench_{i:04d}.csv"), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["statement", "opinion"])
+            for statement in pct_statements:
+                writer.writerow([statement, rng.choice(opinions).capitalize()])
+
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize_metrics(metrics_path):
+    """Collapses the per-file metrics records into per-step p50/p90/p99 latencies."""
+    steps, durations = {}, []
+    if not os.path.exists(metrics_path):
+        return steps, durations
+    with open(metrics_path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("duration") is not None:
+                durations.append(record["duration"])
+            for step, samples in record["steps"].items():
+                steps.setdefault(step, []).extend(samples)
+    summary = {step: {"count": len(samples), "p50": percentile(samples, 0.5),
+                      "p90": percentile(samples, 0.9), "p99": percentile(samples, 0.99)}
+               for step, samples in steps.items()}
+    return summary, durations
+
+
+def run_config(name, extra_args, input_dir, work_dir, site_url, file_count, sample_interval):
+    """Runs main.py with one configuration and returns its measurements."""
+    run_dir = os.path.join(work_dir, name)
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+    metrics_path = os.path.join(run_dir, "metrics.jsonl")
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py"),
+               "--input_dir", input_dir,
+               "--output_dir", os.path.join(run_dir, "output"),
+               "--broken_dir", os.path.join(run_dir, "broken"),
+               "--site_url", site_url,
+               "--cache_dir", os.path.join(run_dir, "cache"), "--no_cache",
+               "--metrics_jsonl", metrics_path] + shlex.split(extra_args)
+    logging.info(f"Running {name}: {' '.join(command)}")
+
+    started = time.perf_counter()
+    peak_rss = 0
+    with open(os.path.join(run_dir, "main.log"), 'w') as log_file:
+        process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+        while process.poll() is None:
+            peak_rss = max(peak_rss, process_tree_rss(process.pid))
+            time.sleep(sample_interval)
+    elapsed = time.perf_counter() - started
+
+    steps, durations = summarize_metrics(metrics_path)
+    # Parsed like main.py parses it, so --workers=2 and abbreviations count too
+    workers_parser = argparse.ArgumentParser(add_help=False)
+    workers_parser.add_argument("--workers", type=int, default=1)
+    workers = max(1, workers_parser.parse_known_args(shlex.split(extra_args))[0].workers)
+    result = {
+        "exit_code": process.returncode,
+        "elapsed": elapsed,
+        "files": len(durations),
+        "files_per_hour": len(durations) / elapsed * 3600 if elapsed else 0.0,
+        "file_duration_p50": percentile(durations, 0.5) if durations else None,
+        "file_duration_p90": percentile(durations, 0.9) if durations else None,
+        "peak_rss_mb": peak_rss / 1e6,
+        "peak_rss_per_worker_mb": peak_rss / 1e6 / workers,
+        "steps": steps,
+    }
+    if process.returncode != 0 or len(durations) < file_count:
+        logging.warning(f"{name}: exit code {process.returncode}, {len(durations)}/{file_count} files measured; "
+                        f"see {os.path.join(run_dir, 'main.log')}")
+    return result
+
+
+def print_report(results):
+    for name, result in results.items():
+        print(f"\n== {name} ==")
+        print(f"  files: {result['files']}  elapsed: {result['elapsed']:.1f}s  "
+              f"files/hour: {result['files_per_hour']:.0f}")
+        print(f"  peak RSS: {result['peak_rss_mb']:.0f} MB  per worker: {result['peak_rss_per_worker_mb']:.0f} MB")
+        for step, stats in sorted(result["steps"].items()):
+            print(f"  {step:<40} n={stats['count']:<5} p50={stats['p50']:.3f}s "
+                  f"p90={stats['p90']:.3f}s p99={stats['p99']:.3f}s")
+
+
+def find_regressions(results, baseline, tolerance):
+    """Returns a description of every metric that is worse than the baseline by more than tolerance."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result["files_per_hour"] < before["files_per_hour"] * (1 - tolerance):
+            regressions.append(f"{name}: files/hour {result['files_per_hour']:.0f} "
+                               f"vs baseline {before['files_per_hour']:.0f}")
+        if result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {result['peak_rss_mb']:.0f} MB "
+                               f"vs baseline {before['peak_rss_mb']:.0f} MB")
+        for step, stats in result["steps"].items():
+            old = before.get("steps", {}).get(step)
+            if old and stats["p90"] > old["p90"] * (1 + tolerance):
+                regressions.append(f"{name}: {step} p90 {stats['p90']:.3f}s vs baseline {old['p90']:.3f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark main.py end to end against the local mock PCT server")
+    parser.add_argument("--files", type=int, default=10, help="Number of synthetic CSV files per run (default: 10)")
+    parser.add_argument("--config", action="append", metavar="NAME=ARGS",
+                        help="A configuration to run, as a name and extra main.py arguments; may be repeated "
+                             f"(default: {', '.join(default_configs)})")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of delay the mock server adds per response")
+    parser.add_argument("--popup_rate", type=float, default=0.0, help="Probability of a pop-up overlay per page")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated answers and the mock site")
+    parser.add_argument("--sample_interval", type=float, default=0.5, help="Seconds between memory samples (default: 0.5)")
+    parser.add_argument("--work_dir", help="Directory for inputs and run outputs (default: a temporary directory)")
+    parser.add_argument("--output", help="Write the results as JSON to this path (usable as a later --baseline)")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed relative regression against --baseline (default: 0.1)")
+    args = parser.parse_args()
+
+    configs = dict(default_configs)
+    if args.config:
+        configs = {}
+        for config in args.config:
+            name, _, extra_args = config.partition("=")
+            configs[name.strip()] = extra_args
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="pct_bench_")
+    input_dir = os.path.join(work_dir, "input")
+    shutil.rmtree(input_dir, ignore_errors=True)
+    os.makedirs(input_dir)
+    generate_csv_files(input_dir, args.files, args.seed)
+
+    server, site_url = start_mock_server(latency=args.latency, popup_rate=args.popup_rate, seed=args.seed)
+    try:
+        results = {name: run_config(name, extra_args, input_dir, work_dir, site_url, args.files, args.sample_interval)
+                   for name, extra_args in configs.items()}
+    finally:
+        server.shutdown()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        logging.info(f"Benchmark results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            logging.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        logging.info("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
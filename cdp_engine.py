@@ -0,0 +1,543 @@
+"""Async multi-tab engine: runs many Political Compass tests as isolated tabs of one Chrome.
+
+Talks to Chrome over the DevTools protocol directly (no WebDriver), giving each
+test its own browser context so cookies and storage never leak between files.
+The matching, answering and result-parsing logic is shared with main.py.
+"""
+import asyncio
+import base64
+import contextlib
+import json
+import logging
+import os
+import shutil
+import struct
+import time
+from urllib.parse import urlparse
+
+import main as pct
+
+
+class CdpError(Exception):
+    """Raised when Chrome reports an error for a DevTools command or the connection drops."""
+
+
+class CdpConnectionLost(CdpError):
+    """Raised when the DevTools connection closes, Chrome does not come up, or the tab's target is gone.
+
+    Unlike other CDP errors (a missing button, a script exception) these are
+    worth retrying on a fresh browser.
+    """
+
+
+# Command errors Chrome reports once a tab's target has crashed or been detached
+target_lost_messages = ("target closed", "session with given id not found", "target crashed")
+
+
+class CdpConnection:
+    """Minimal asyncio WebSocket client speaking the Chrome DevTools protocol."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        self.pending = {}
+        self.closed = False
+        self.read_task = asyncio.create_task(self._read_loop())
+
+    @classmethod
+    async def connect(cls, ws_url):
+        """Opens a WebSocket connection to a DevTools endpoint."""
+        url = urlparse(ws_url)
+        # PDFs and large DOM payloads arrive as single frames, so allow big reads
+        reader, writer = await asyncio.open_connection(url.hostname, url.port, limit=2 ** 26)
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        writer.write((f"GET {url.path} HTTP/1.1\r\n"
+                      f"Host: {url.hostname}:{url.port}\r\n"
+                      "Upgrade: websocket\r\n"
+                      "Connection: Upgrade\r\n"
+                      f"Sec-WebSocket-Key: {key}\r\n"
+                      "Sec-WebSocket-Version: 13\r\n\r\n").encode("ascii"))
+        await writer.drain()
+        response = await reader.readuntil(b"\r\n\r\n")
+        if b" 101 " not in response.split(b"\r\n", 1)[0]:
+            writer.close()
+            raise CdpConnectionLost(f"WebSocket handshake with {ws_url} failed: {response[:200]!r}")
+        return cls(reader, writer)
+
+    async def send(self, method, params=None, session_id=None):
+        """Sends a DevTools command and waits for its result."""
+        if self.closed:
+            raise CdpConnectionLost("DevTools connection is closed")
+        self.next_id += 1
+        message = {"id": self.next_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.next_id] = future
+        await self._send_frame(0x1, json.dumps(message).encode("utf-8"))
+        return await future
+
+    async def _send_frame(self, opcode, payload):
+        header = bytearray([0x80 | opcode])
+        length = len(payload)
+        # Client frames must be masked
+        if length < 126:
+            header.append(0x80 | length)
+        elif length < 2 ** 16:
+            header.append(0x80 | 126)
+            header += struct.pack("!H", length)
+        else:
+            header.append(0x80 | 127)
+            header += struct.pack("!Q", length)
+        mask = os.urandom(4)
+        masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        self.writer.write(bytes(header) + mask + masked)
+        await self.writer.drain()
+
+    async def _read_frame(self):
+        first, second = await self.reader.readexactly(2)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await self.reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await self.reader.readexactly(8))[0]
+        mask = await self.reader.readexactly(4) if second & 0x80 else None
+        payload = await self.reader.readexactly(length)
+        if mask:
+            payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        return bool(first & 0x80), opcode, payload
+
+    async def _read_loop(self):
+        fragments = []
+        try:
+            while True:
+                fin, opcode, payload = await self._read_frame()
+                if opcode == 0x8:  # close
+                    break
+                if opcode == 0x9:  # ping
+                    await self._send_frame(0xA, payload)
+                    continue
+                if opcode in (0x0, 0x1, 0x2):
+                    fragments.append(payload)
+                    if not fin:
+                        continue
+                    message = json.loads(b"".join(fragments))
+                    fragments = []
+                    future = self.pending.pop(message.get("id"), None)
+                    if future and not future.done():
+                        if "error" in message:
+                            error_message = message["error"].get("message", str(message["error"]))
+                            lost = any(marker in error_message.lower() for marker in target_lost_messages)
+                            future.set_exception((CdpConnectionLost if lost else CdpError)(error_message))
+                        else:
+                            future.set_result(message.get("result", {}))
+                    # Events are ignored: the engine polls page state instead
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            logging.warning(f"DevTools connection lost: {e}")
+        finally:
+            self.closed = True
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(CdpConnectionLost("DevTools connection closed"))
+            self.pending.clear()
+
+    async def close(self):
+        """Closes the socket."""
+        self.closed = True
+        self.read_task.cancel()
+        self.writer.close()
+
+
+class CdpBrowser:
+    """One headless Chrome process shared by many test tabs.
+
+    Like main.BrowserSession, it is due for a restart after ``max_files``
+    files, once its process tree uses more than ``max_rss_mb``, or once it is
+    older than ``max_age`` seconds; run_files_cdp restarts it once the tabs
+    in flight have finished.
+    """
+
+    def __init__(self, max_files=None, max_rss_mb=None, max_age=None):
+        self.process = None
+        self.connection = None
+        self.temp_user_data_dir = None
+        self.lock = asyncio.Lock()
+        self.max_files = max_files
+        self.max_rss_mb = max_rss_mb
+        self.max_age = max_age
+        self.files_served = 0
+        self.started = None
+
+    async def ensure_running(self):
+        """Starts Chrome, or restarts it if the previous one died."""
+        async with self.lock:
+            if self.connection is not None and not self.connection.closed:
+                return
+            if self.process is not None:
+                logging.warning("Chrome connection lost, restarting the browser.")
+                await self.close()
+            await self._launch()
+
+    async def _launch(self):
+        self.temp_user_data_dir = pct.make_chrome_profile_dir()
+        args = [pct.chrome_binary_path, "--headless=new", "--disable-gpu", "--no-sandbox",
+                "--disable-dev-shm-usage", "--window-size=1920,1080",
+                f"--user-data-dir={self.temp_user_data_dir}", "--remote-debugging-port=0"]
+        if pct.run_settings["block_resources"]:
+            args.append(f"--host-resolver-rules={pct.host_resolver_rules(pct.run_settings['allow_domains'])}")
+        args.append("about:blank")
+        self.process = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+
+        # Chrome writes the port it picked and the browser endpoint path to DevToolsActivePort
+        port_file = os.path.join(self.temp_user_data_dir, "DevToolsActivePort")
+        deadline = time.monotonic() + pct.wait_settings["timeout"] * 3
+        while not os.path.exists(port_file):
+            if self.process.returncode is not None or time.monotonic() > deadline:
+                raise CdpConnectionLost("Chrome did not start its DevTools endpoint")
+            await asyncio.sleep(pct.wait_settings["poll_frequency"])
+        await asyncio.sleep(pct.wait_settings["poll_frequency"])  # let Chrome finish writing the file
+        with open(port_file, "r", encoding="utf-8") as f:
+            port, path = f.read().split()[:2]
+
+        self.connection = await CdpConnection.connect(f"ws://127.0.0.1:{port}{path}")
+        self.files_served = 0
+        self.started = time.monotonic()
+        version = await self.connection.send("Browser.getVersion")
+        logging.info(f"Chrome Version: {version.get('product')} (CDP engine, pid {self.process.pid})")
+
+    def recycle_reason(self):
+        """Returns why the running browser should be restarted, or None if it is within its limits."""
+        if self.process is None or self.started is None:
+            return None
+        if self.max_files and self.files_served >= self.max_files:
+            return f"after {self.files_served} files"
+        try:
+            rss_mb = pct.process_tree_rss(self.process.pid) / 1e6
+        except OSError:
+            rss_mb = None
+        if rss_mb is not None:
+            logging.info(f"Browser memory after {self.files_served} files: {rss_mb:.0f} MB")
+        age = time.monotonic() - self.started
+        if self.max_rss_mb and rss_mb is not None and rss_mb > self.max_rss_mb:
+            return f"at {rss_mb:.0f} MB (limit {self.max_rss_mb} MB)"
+        if self.max_age and age > self.max_age:
+            return f"after {age:.0f}s (limit {self.max_age:.0f}s)"
+        return None
+
+    async def close(self):
+        """Shuts Chrome down and removes its temporary profile."""
+        if self.connection is not None:
+            try:
+                await asyncio.wait_for(self.connection.send("Browser.close"), 5)
+            except Exception:
+                pass
+            await self.connection.close()
+            self.connection = None
+        if self.process is not None:
+            if self.process.returncode is None:
+                try:
+                    await asyncio.wait_for(self.process.wait(), 5)
+                except asyncio.TimeoutError:
+                    self.process.kill()
+                    await self.process.wait()
+            self.process = None
+        if self.temp_user_data_dir:
+            shutil.rmtree(self.temp_user_data_dir, ignore_errors=True)
+            self.temp_user_data_dir = None
+
+
+class CdpTab:
+    """A page in its own browser context, so each test starts with clean state."""
+
+    def __init__(self, browser, context_id, target_id, session_id):
+        self.browser = browser
+        self.context_id = context_id
+        self.target_id = target_id
+        self.session_id = session_id
+        self.step_latencies = {}
+
+    @classmethod
+    async def open(cls, browser):
+        """Creates an isolated browser context with one tab and attaches to it."""
+        connection = browser.connection
+        context = await connection.send("Target.createBrowserContext", {"disposeOnDetach": True})
+        target = await connection.send("Target.createTarget",
+                                       {"url": "about:blank", "browserContextId": context["browserContextId"]})
+        session = await connection.send("Target.attachToTarget", {"targetId": target["targetId"], "flatten": True})
+        tab = cls(browser, context["browserContextId"], target["targetId"], session["sessionId"])
+
+        await tab.send("Page.enable")
+        if pct.run_settings["overlay_dismisser"]:
+            await tab.send("Page.addScriptToEvaluateOnNewDocument", {"source": pct.overlay_dismisser_script})
+        if pct.run_settings["block_resources"] and pct.run_settings["block_types"]:
+            await tab.send("Network.enable")
+            await tab.send("Network.setBlockedURLs",
+                           {"urls": pct.blocked_url_patterns(pct.run_settings["block_types"])})
+        return tab
+
+    async def send(self, method, params=None):
+        """Sends a DevTools command to this tab."""
+        if pct.run_settings["trace_webdriver"]:
+            with pct.timed(f"cdp {method}", self.step_latencies):
+                return await self.browser.connection.send(method, params, session_id=self.session_id)
+        return await self.browser.connection.send(method, params, session_id=self.session_id)
+
+    async def evaluate(self, script, *args):
+        """Runs a function body (as passed to Selenium's execute_script) with arguments and returns its value."""
+        expression = f"(function () {{ {script} }}).apply(null, {json.dumps(list(args))})"
+        result = await self.send("Runtime.evaluate", {"expression": expression, "returnByValue": True,
+                                                      "awaitPromise": True})
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            raise CdpError(details.get("exception", {}).get("description") or details.get("text"))
+        return result["result"].get("value")
+
+    async def wait_for(self, script, step, timeout=None):
+        """Polls a script until it returns a truthy value, recording how long the step took."""
+        timeout = timeout or pct.wait_settings["timeout"]
+        started = time.perf_counter()
+        try:
+            while True:
+                try:
+                    value = await self.evaluate(script)
+                except CdpConnectionLost:
+                    raise
+                except CdpError:
+                    value = None  # the page is between documents
+                if value:
+                    return value
+                if time.perf_counter() - started > timeout:
+                    raise TimeoutError(f"Timed out after {timeout}s waiting for {step}")
+                await asyncio.sleep(pct.wait_settings["poll_frequency"])
+        finally:
+            pct.record_step_latency(step, time.perf_counter() - started, self.step_latencies)
+
+    async def navigate(self, url):
+        """Loads a URL and waits for the new document to finish loading."""
+        await self.evaluate("window.__pctLeaving = true;")
+        async with site_request(self):
+            with pct.timed("page load", self.step_latencies):
+                await self.send("Page.navigate", {"url": url})
+            await self.wait_for("return !window.__pctLeaving && document.readyState === 'complete';", "page ready")
+
+    async def close(self):
+        """Closes the tab and disposes of its browser context."""
+        if self.browser.connection is None or self.browser.connection.closed:
+            return
+        try:
+            await self.browser.connection.send("Target.closeTarget", {"targetId": self.target_id})
+            await self.browser.connection.send("Target.disposeBrowserContext", {"browserContextId": self.context_id})
+        except CdpError as e:
+            logging.warning(f"Error closing tab: {e}")
+
+
+@contextlib.asynccontextmanager
+async def site_request(tab):
+    """Like main.site_request, without blocking the event loop while waiting for a token."""
+    limiter = pct.rate_limiter
+    if limiter is None:
+        yield
+        return
+    with pct.timed("rate limit wait", tab.step_latencies):
+        await asyncio.sleep(limiter.reserve())
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        limiter.record(time.perf_counter() - started, pct.classify_failure(e) == "transient")
+        raise
+    limiter.record(time.perf_counter() - started, False)
+
+
+# Marks the current document as left behind and clicks the button whose text contains arguments[0]
+click_button_script = """
+var buttons = document.querySelectorAll('button');
+for (var i = 0; i < buttons.length; i++) {
+    if (buttons[i].textContent.indexOf(arguments[0]) !== -1) {
+        window.__pctLeaving = true;
+        buttons[i].click();
+        return true;
+    }
+}
+return false;
+"""
+
+# True once the document that was left behind has been replaced and is usable
+next_document_script = "return !window.__pctLeaving && document.readyState !== 'loading';"
+
+compass_text_script = """
+var headings = document.querySelectorAll('h2');
+for (var i = 0; i < headings.length; i++) {
+    if (headings[i].textContent.indexOf('Economic Left/Right') !== -1) {
+        return headings[i].innerText.trim();
+    }
+}
+return null;
+"""
+
+chart_link_script = """
+var links = document.querySelectorAll('a');
+for (var i = 0; i < links.length; i++) {
+    if (links[i].textContent.indexOf('Show chart in a separate window for printing') !== -1) {
+        return links[i].href;
+    }
+}
+return null;
+"""
+
+
+async def answer_questions_cdp(tab, answer_sheet, output_dir, file_name, results_data):
+    """Answers all six pages in a tab and records the compass values (and chart PDF)."""
+    total_pages = 6
+    await tab.navigate(f"{pct.pct_base_url}/test/en?page=1")
+
+    for current_page in range(1, total_pages + 1):
+        await tab.wait_for("return document.querySelectorAll('fieldset').length > 0;", "page fieldsets")
+        questions = await tab.evaluate(pct.extract_questions_script)
+        logging.info(f"[{file_name}] Found {len(questions)} questions on page {current_page}.")
+
+        answers = []
+        for index, question in enumerate(questions):
+            if not question["legend"]:
+                continue
+            radio_value = pct.lookup_radio_value(question["legend"], answer_sheet)
+            if radio_value is not None:
+                answers.append([index, radio_value])
+        if answers:
+            selected = await tab.evaluate(pct.select_answers_script, answers)
+            for (index, _), ok in zip(answers, selected):
+                if not ok:
+                    logging.error(f"[{file_name}] Could not select option for question '{questions[index]['legend']}'")
+
+        button_text = "Next page" if current_page < total_pages else "Now let's see where you stand"
+        async with site_request(tab):
+            if not await tab.evaluate(click_button_script, button_text):
+                raise CdpError(f"'{button_text}' button not found on page {current_page}")
+            await tab.wait_for(next_document_script, "next page load")
+
+    h2_text = await tab.wait_for(compass_text_script, "compass values")
+    logging.info(f"[{file_name}] Found compass values text: {h2_text}")
+    results_data[file_name] = pct.parse_compass_text(h2_text)
+
+    if pct.run_settings["pdf"] and pct.run_settings["chart"] != "browser":
+        pct.write_local_chart(output_dir, file_name, results_data[file_name], tab.step_latencies)
+    elif pct.run_settings["pdf"]:
+        link_url = await tab.evaluate(chart_link_script)
+        if link_url:
+            await tab.navigate(link_url)
+            with pct.timed("save pdf", tab.step_latencies):
+                pdf_data = await tab.send("Page.printToPDF", {"format": "A4"})
+            pct.get_pdf_writer().submit(pdf_data["data"], pct.chart_pdf_path(output_dir, file_name))
+        else:
+            logging.error(f"[{file_name}] Chart link not found on the results page.")
+
+
+def record_failure(file_name, error, results_data):
+    """Records a file as failed, like the except block of main.process_csv_file."""
+    logging.error(f"Error processing file {file_name}: {error}")
+    failure = "transient" if isinstance(error, CdpConnectionLost) else pct.classify_failure(error)
+    results_data[file_name] = {"economic": "Error", "social": "Error", "failure": failure}
+
+
+async def process_csv_file_cdp(browser, limit, csv_path, output_dir, results_data):
+    """Processes one CSV file in its own tab once a slot under the concurrency limit is free."""
+    file_name = os.path.basename(csv_path)
+    started = time.perf_counter()
+    try:
+        answer_sheet = await asyncio.to_thread(pct.load_answer_sheet, csv_path)
+        if answer_sheet is None:
+            logging.error(f"No questions and answers loaded from CSV file: {file_name}")
+            results_data[file_name] = {"economic": "No data", "social": "No data"}
+            return
+
+        cache, cache_key = pct.open_result_cache(answer_sheet)
+        # A file answered from the cache never gets a tab to hold its step timings
+        cache_latencies = {}
+        if pct.use_cached_result(cache, cache_key, output_dir, file_name, results_data, cache_latencies):
+            pct.log_step_latencies(file_name, time.perf_counter() - started, cache_latencies)
+            return
+    except Exception as e:
+        record_failure(file_name, e, results_data)
+        return
+
+    async with limit:
+        logging.info(f"Processing file: {file_name} (CDP tab)")
+        tab = None
+        try:
+            await browser.ensure_running()
+            tab = await CdpTab.open(browser)
+            with pct.timed("answer questions", tab.step_latencies):
+                await answer_questions_cdp(tab, answer_sheet, output_dir, file_name, results_data)
+        except Exception as e:
+            record_failure(file_name, e, results_data)
+        finally:
+            if tab is not None:
+                browser.files_served += 1
+                await tab.close()
+                pct.log_step_latencies(file_name, time.perf_counter() - started, tab.step_latencies)
+
+    try:
+        pct.store_result_in_cache(cache, cache_key, output_dir, file_name, results_data)
+    except Exception as e:
+        record_failure(file_name, e, results_data)
+
+
+async def run_files_cdp(csv_files, output_dir, results_data, tabs, on_result, scheduler, recycle_after=None):
+    """Runs every file through one shared browser, with at most `tabs` tests in flight."""
+    browser = CdpBrowser(recycle_after, pct.run_settings["recycle_rss_mb"], pct.run_settings["recycle_age"])
+    recycle_reason = None
+    limit = asyncio.Semaphore(tabs)
+    finished = 0
+
+    async def run_one(csv_path):
+        await process_csv_file_cdp(browser, limit, csv_path, output_dir, results_data)
+        return csv_path
+
+    in_flight = set()
+    try:
+        while scheduler.pending() or in_flight:
+            if recycle_reason and not in_flight:
+                logging.info(f"Recycling the CDP browser {recycle_reason}.")
+                await browser.close()
+                recycle_reason = None
+            # A browser due for recycling takes no new files until its tabs are done
+            while not recycle_reason and len(in_flight) < tabs:
+                csv_path = scheduler.next_ready()
+                if csv_path is None:
+                    break
+                in_flight.add(asyncio.create_task(run_one(csv_path)))
+            if not in_flight:
+                await asyncio.sleep(scheduler.wait_time())
+                continue
+
+            done, in_flight = await asyncio.wait(in_flight, timeout=scheduler.wait_time(),
+                                                 return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                csv_path = task.result()
+                if scheduler.finish(csv_path, results_data):
+                    finished += 1
+                    if on_result:
+                        on_result(csv_path)
+                    logging.info(f"Completed {finished}/{scheduler.total} files")
+            if done and recycle_reason is None:
+                recycle_reason = browser.recycle_reason()
+    finally:
+        for task in in_flight:
+            task.cancel()
+        await browser.close()
+
+
+def process_csv_files_cdp(csv_files, output_dir, results_data, tabs, on_result=None, scheduler=None,
+                          recycle_after=None):
+    """Processes CSV files as concurrent tabs of one Chrome, at most `tabs` at a time.
+
+    Transient failures are re-queued through the retry scheduler; each retry
+    gets a new browser context. The browser is restarted after recycle_after
+    files or past the --recycle_rss_mb/--recycle_age_minutes limits.
+    """
+    logging.info(f"Starting CDP engine with up to {tabs} concurrent tabs")
+    scheduler = scheduler or pct.RetryScheduler(csv_files, max_retries=0)
+    asyncio.run(run_files_cdp(csv_files, output_dir, results_data, tabs, on_result, scheduler, recycle_after))
@@ -0,0 +1,207 @@
+"""Draws Political Compass charts locally from Economic/Social scores, as SVG or PDF.
+
+Replaces printing the site's chart page in the browser: a chart is a few
+rectangles, grid lines and points, so it is written directly from the scores.
+The same drawing is used for one file's chart and for a comparison chart with
+every file of a run.
+
+    python compass_chart.py output_dir/output_dir_results.csv -o comparison.svg
+"""
+import argparse
+import csv
+import os
+
+# Quadrant colours of the site's chart
+quadrant_colors = {"auth_left": "#ff7575", "auth_right": "#42aaff", "lib_left": "#9aed97", "lib_right": "#c09aec"}
+
+width, height = 560, 600
+plot_left, plot_top, plot_size = 80, 80, 420
+
+# Points beyond this many are drawn without file-name labels
+label_limit = 40
+
+
+def to_plot(economic, social):
+    """Maps compass values (-10..10 on both axes) to chart coordinates (y grows downwards)."""
+    x = plot_left + (economic + 10) / 20 * plot_size
+    y = plot_top + (10 - social) / 20 * plot_size
+    return x, y
+
+
+def chart_shapes(points, title):
+    """Returns the drawing as a list of shape tuples shared by the SVG and PDF writers.
+
+    points is a list of (label, economic, social); labels may be None.
+    """
+    half = plot_size / 2
+    shapes = [
+        ("rect", plot_left, plot_top, half, half, quadrant_colors["auth_left"]),
+        ("rect", plot_left + half, plot_top, half, half, quadrant_colors["auth_right"]),
+        ("rect", plot_left, plot_top + half, half, half, quadrant_colors["lib_left"]),
+        ("rect", plot_left + half, plot_top + half, half, half, quadrant_colors["lib_right"]),
+    ]
+    for step in range(21):
+        offset = plot_left + step * plot_size / 20
+        line_width = 2 if step == 10 else 0.5
+        shapes.append(("line", offset, plot_top, offset, plot_top + plot_size, "#555555", line_width))
+        offset = plot_top + step * plot_size / 20
+        shapes.append(("line", plot_left, offset, plot_left + plot_size, offset, "#555555", line_width))
+    for value in (-10, -5, 0, 5, 10):
+        x, y = to_plot(value, value)
+        shapes.append(("text", x, plot_top + plot_size + 16, str(value), 10, "middle"))
+        shapes.append(("text", plot_left - 8, y + 4, str(value), 10, "end"))
+
+    center_x = plot_left + half
+    shapes += [
+        ("text", width / 2, 30, title, 14, "middle"),
+        ("text", center_x, plot_top - 10, "Authoritarian", 12, "middle"),
+        ("text", center_x, plot_top + plot_size + 36, "Libertarian", 12, "middle"),
+        ("text", plot_left - 36, plot_top + half + 4, "Left", 12, "end"),
+        ("text", plot_left + plot_size + 8, plot_top + half + 4, "Right", 12, "start"),
+        ("text", width / 2, height - 20, "Economic Left/Right (x), Social Libertarian/Authoritarian (y)", 10, "middle"),
+    ]
+
+    show_labels = len(points) <= label_limit
+    for label, economic, social in points:
+        x, y = to_plot(max(-10.0, min(10.0, economic)), max(-10.0, min(10.0, social)))
+        shapes.append(("circle", x, y, 6 if len(points) == 1 else 4, "#e00000", "#000000"))
+        if label and show_labels:
+            shapes.append(("text", x + 7, y - 5, label, 8, "start"))
+    return shapes
+
+
+def escape_xml(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+
+def render_svg(shapes):
+    """Returns the shapes as an SVG document."""
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'viewBox="0 0 {width} {height}" font-family="Helvetica, Arial, sans-serif">',
+             f'<rect x="0" y="0" width="{width}" height="{height}" fill="#ffffff"/>']
+    for shape in shapes:
+        kind = shape[0]
+        if kind == "rect":
+            _, x, y, w, h, fill = shape
+            parts.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{w:.1f}" height="{h:.1f}" fill="{fill}"/>')
+        elif kind == "line":
+            _, x1, y1, x2, y2, stroke, line_width = shape
+            parts.append(f'<line x1="{x1:.1f}" y1="{y1:.1f}" x2="{x2:.1f}" y2="{y2:.1f}" '
+                         f'stroke="{stroke}" stroke-width="{line_width}"/>')
+        elif kind == "circle":
+            _, cx, cy, r, fill, stroke = shape
+            parts.append(f'<circle cx="{cx:.1f}" cy="{cy:.1f}" r="{r}" fill="{fill}" stroke="{stroke}"/>')
+        elif kind == "text":
+            _, x, y, text, size, anchor = shape
+            parts.append(f'<text x="{x:.1f}" y="{y:.1f}" font-size="{size}" text-anchor="{anchor}">'
+                         f'{escape_xml(text)}</text>')
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
+
+
+def pdf_color(hex_color):
+    return " ".join(f"{int(hex_color[i:i + 2], 16) / 255:.3f}" for i in (1, 3, 5))
+
+
+def pdf_string(text):
+    """Encodes text as a PDF literal string in the standard Helvetica encoding."""
+    text = text.encode("latin-1", "replace").decode("latin-1")
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def render_pdf(shapes):
+    """Returns the shapes as a one-page PDF document (bytes) using only the built-in Helvetica font."""
+    ops = []
+    for shape in shapes:
+        kind = shape[0]
+        if kind == "rect":
+            _, x, y, w, h, fill = shape
+            ops.append(f"{pdf_color(fill)} rg {x:.2f} {height - y - h:.2f} {w:.2f} {h:.2f} re f")
+        elif kind == "line":
+            _, x1, y1, x2, y2, stroke, line_width = shape
+            ops.append(f"{pdf_color(stroke)} RG {line_width} w {x1:.2f} {height - y1:.2f} m "
+                       f"{x2:.2f} {height - y2:.2f} l S")
+        elif kind == "circle":
+            _, cx, cy, r, fill, stroke = shape
+            cy = height - cy
+            k = 0.5523 * r  # Bezier control offset for a quarter circle
+            ops.append(f"{pdf_color(fill)} rg {pdf_color(stroke)} RG 1 w "
+                       f"{cx + r:.2f} {cy:.2f} m "
+                       f"{cx + r:.2f} {cy + k:.2f} {cx + k:.2f} {cy + r:.2f} {cx:.2f} {cy + r:.2f} c "
+                       f"{cx - k:.2f} {cy + r:.2f} {cx - r:.2f} {cy + k:.2f} {cx - r:.2f} {cy:.2f} c "
+                       f"{cx - r:.2f} {cy - k:.2f} {cx - k:.2f} {cy - r:.2f} {cx:.2f} {cy - r:.2f} c "
+                       f"{cx + k:.2f} {cy - r:.2f} {cx + r:.2f} {cy - k:.2f} {cx + r:.2f} {cy:.2f} c b")
+        elif kind == "text":
+            _, x, y, text, size, anchor = shape
+            # Helvetica averages about half an em per character, close enough to centre labels
+            text_width = len(text) * size * 0.5
+            if anchor == "middle":
+                x -= text_width / 2
+            elif anchor == "end":
+                x -= text_width
+            ops.append(f"0 0 0 rg BT /F1 {size} Tf {x:.2f} {height - y:.2f} Td {pdf_string(text)} Tj ET")
+    content = "\n".join(ops).encode("latin-1")
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+        f"/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>".encode("ascii"),
+        b"<< /Length " + str(len(content)).encode("ascii") + b" >>\nstream\n" + content + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    document = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(document))
+        document += f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n"
+    xref_offset = len(document)
+    document += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii")
+    for offset in offsets:
+        document += f"{offset:010d} 00000 n \n".encode("ascii")
+    document += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+                 f"startxref\n{xref_offset}\n%%EOF\n").encode("ascii")
+    return bytes(document)
+
+
+def write_chart(path, points, title):
+    """Writes a compass chart of points [(label, economic, social)] to path; the extension picks SVG or PDF."""
+    shapes = chart_shapes(points, title)
+    if path.lower().endswith(".svg"):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(render_svg(shapes))
+    else:
+        with open(path, "wb") as f:
+            f.write(render_pdf(shapes))
+    return path
+
+
+def read_results_csv(results_csv):
+    """Reads (file name, economic, social) points with numeric scores from a *_results.csv."""
+    points = []
+    with open(results_csv, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                points.append((row["File Name"], float(row["Economic Left/Right"]),
+                               float(row["Social Libertarian/Authoritarian"])))
+            except (KeyError, TypeError, ValueError):
+                continue  # Error / No data rows
+    return points
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Draw one comparison compass chart from a results CSV")
+    parser.add_argument("results_csv", help="A *_results.csv written by main.py")
+    parser.add_argument("-o", "--output", help="Output .svg or .pdf (default: next to the CSV, as SVG)")
+    parser.add_argument("--title", help="Chart title (default: the CSV's name)")
+    args = parser.parse_args()
+
+    points = read_results_csv(args.results_csv)
+    base = os.path.splitext(args.results_csv)[0]
+    output = args.output or f"{base}_compass.svg"
+    write_chart(output, points, args.title or os.path.basename(base))
+    print(f"Plotted {len(points)} results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Local stand-in for the Political Compass test, for offline testing and benchmarks.
+
+Serves the same structure the automation depends on: six pages of fieldsets
+with a legend and four radio inputs (values 0-3), the "Next page" and
+"Now let's see where you stand" buttons, a results page whose h2 holds the
+Economic/Social values, and the "Show chart in a separate window for printing"
+link. Answers are carried between pages in hidden inputs, like a plain form.
+
+Scores use fixed pseudo-random weights per (question, answer), so they are
+deterministic but are NOT the real site's scores.
+
+    python mock_pct_server.py --port 8000 --latency 0.05 --popup_rate 0.2
+    python main.py --site_url http://127.0.0.1:8000 ...
+"""
+import argparse
+import html
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from main import pct_statements
+
+# Number of statements on each of the six pages
+page_sizes = [7, 14, 18, 12, 5, 6]
+
+option_labels = ["Strongly disagree", "Disagree", "Agree", "Strongly agree"]
+
+
+def page_question_ids(page):
+    """Returns the canonical question IDs shown on a 1-based page."""
+    start = sum(page_sizes[:page - 1])
+    return list(range(start, start + page_sizes[page - 1]))
+
+
+class MockPctSite:
+    """Page rendering and scoring shared by every request handler."""
+
+    def __init__(self, latency=0.0, popup_rate=0.0, seed=0):
+        self.latency = latency
+        self.popup_rate = popup_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        weights = random.Random(seed)
+        self.weights = {axis: [[weights.uniform(-3, 3) for _ in range(4)] for _ in pct_statements]
+                        for axis in ("economic", "social")}
+        self.requests_served = 0
+
+    def show_popup(self):
+        with self.lock:
+            self.requests_served += 1
+            return self.random.random() < self.popup_rate
+
+    def score(self, answers):
+        """Scores answers ({question ID: 0-3}) on both axes, clamped to the compass range."""
+        scores = {}
+        for axis in ("economic", "social"):
+            total = sum(self.weights[axis][qid][answer] for qid, answer in answers.items())
+            scores[axis] = max(-10.0, min(10.0, total / 4.0))
+        return scores
+
+    def render_test_page(self, page, answers):
+        carried = "".join(f'<input type="hidden" name="q{qid}" value="{answer}">'
+                          for qid, answer in sorted(answers.items()))
+        fieldsets = []
+        for qid in page_question_ids(page):
+            options = "".join(
+                f'<label><input type="radio" name="q{qid}" value="{value}"> {label}</label>'
+                for value, label in enumerate(option_labels))
+            fieldsets.append(f"<fieldset><legend>{html.escape(pct_statements[qid])}</legend>{options}</fieldset>")
+        if page < len(page_sizes):
+            action = f"/test/en?page={page + 1}"
+            button = "Next page"
+        else:
+            action = "/test/en/results"
+            button = "Now let's see where you stand"
+        body = (f'<h1>Political Compass (mock) - page {page}</h1>'
+                f'<form method="post" action="{action}">{carried}{"".join(fieldsets)}'
+                f'<button type="submit">{html.escape(button)}</button></form>')
+        return self.render_document(f"Test page {page}", body)
+
+    def render_results_page(self, answers):
+        scores = self.score(answers)
+        chart_query = urlencode({"ec": f"{scores['economic']:.2f}", "soc": f"{scores['social']:.2f}"})
+        body = (f"<h2>Economic Left/Right: {scores['economic']:.2f}<br>"
+                f"Social Libertarian/Authoritarian: {scores['social']:.2f}</h2>"
+                f'<p><a href="/chart?{chart_query}">Show chart in a separate window for printing</a></p>')
+        return self.render_document("Your results", body)
+
+    def render_chart_page(self, economic, social):
+        x = 200 + economic * 20
+        y = 200 - social * 20
+        body = ('<svg xmlns="http://www.w3.org/2000/svg" width="400" height="400">'
+                '<rect x="0" y="0" width="200" height="200" fill="#ff7575"/>'
+                '<rect x="200" y="0" width="200" height="200" fill="#42aaff"/>'
+                '<rect x="0" y="200" width="200" height="200" fill="#9aed97"/>'
+                '<rect x="200" y="200" width="200" height="200" fill="#c09aec"/>'
+                f'<circle cx="{x:.1f}" cy="{y:.1f}" r="8" fill="red" stroke="black"/></svg>')
+        return self.render_document("Chart", body, popups=False)
+
+    def render_document(self, title, body, popups=True):
+        popup = ""
+        if popups and self.show_popup():
+            # A full-page overlay that intercepts clicks until its close button is pressed
+            popup = ('<div id="overlay" style="position:fixed;top:0;left:0;width:100%;height:100%;'
+                     'background:rgba(0,0,0,0.5);z-index:1000">'
+                     '<button class="close" aria-label="Close" '
+                     'onclick="document.getElementById(\'overlay\').remove()">&times;</button></div>')
+        return (f"<!DOCTYPE html><html><head><title>{html.escape(title)}</title></head>"
+                f"<body>{body}{popup}</body></html>")
+
+
+def parse_answers(fields):
+    """Extracts {question ID: answer} from submitted form fields."""
+    answers = {}
+    for name, values in fields.items():
+        if name.startswith("q") and name[1:].isdigit() and values and values[-1] in ("0", "1", "2", "3"):
+            answers[int(name[1:])] = int(values[-1])
+    return answers
+
+
+class MockPctHandler(BaseHTTPRequestHandler):
+    site = None  # set on the handler subclass built by start_mock_server
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/test/en":
+            self.respond(self.site.render_test_page(1, {}))
+        elif url.path == "/chart":
+            try:
+                self.respond(self.site.render_chart_page(float(query["ec"][0]), float(query["soc"][0])))
+            except (KeyError, ValueError):
+                self.respond("Bad chart parameters", status=400)
+        else:
+            self.respond("Not found", status=404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        answers = parse_answers(parse_qs(self.rfile.read(length).decode("utf-8")))
+        if url.path == "/test/en":
+            try:
+                page = int(parse_qs(url.query)["page"][0])
+            except (KeyError, ValueError):
+                page = 0
+            if not 1 < page <= len(page_sizes):
+                self.respond("Unknown page", status=404)
+                return
+            self.respond(self.site.render_test_page(page, answers))
+        elif url.path == "/test/en/results":
+            self.respond(self.site.render_results_page(answers))
+        else:
+            self.respond("Not found", status=404)
+
+    def respond(self, text, status=200):
+        if self.site.latency:
+            time.sleep(self.site.latency)
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"mock PCT: {format % args}")
+
+
+def start_mock_server(host="127.0.0.1", port=0, latency=0.0, popup_rate=0.0, seed=0):
+    """Starts the mock site on a background thread; returns (server, base_url)."""
+    site = MockPctSite(latency, popup_rate, seed)
+    handler = type("BoundMockPctHandler", (MockPctHandler,), {"site": site})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-pct-server", daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    logging.info(f"Mock PCT server listening on {base_url}")
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the Political Compass test")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of delay added to every response")
+    parser.add_argument("--popup_rate", type=float, default=0.0,
+                        help="Probability that a test or results page shows a click-blocking overlay")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the scoring weights and pop-ups")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(args.host, args.port, args.latency, args.popup_rate, args.seed)
+    print(f"Serving mock Political Compass test at {base_url}/test/en?page=1 (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Shared SQLite work queue for running one sweep on several machines.
+
+The coordinator (main.py with --queue) enqueues the input files and waits for
+them; workers (main.py --queue PATH --worker) on any node that can see the
+queue file and the CSV paths claim files under a lease, process them with the
+usual engine and write the results back. Workers renew their leases with a
+heartbeat, so the files of a worker that dies return to the queue once its
+leases expire. The coordinator then writes one merged results CSV and
+broken-files list as in a local run.
+
+    python main.py --input_dir /shared/csvs --output_dir /shared/out --broken_dir /shared/broken --queue /shared/queue.db
+    python main.py --output_dir /shared/out --queue /shared/queue.db --worker --workers 4   # on each node
+"""
+import contextlib
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import main as pct
+
+schema = """CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    content_hash TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires REAL,
+    available_at REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    economic TEXT,
+    social TEXT,
+    failure TEXT,
+    finished TEXT
+)"""
+
+
+class WorkQueue:
+    """The files table of a sweep: pending, leased to a worker, or done with a result."""
+
+    def __init__(self, path, lease_seconds=300):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        with self.transaction() as db:
+            db.execute(schema)
+
+    @contextlib.contextmanager
+    def transaction(self, immediate=True):
+        """Yields a connection inside a transaction; immediate takes the write lock up front, otherwise only a shared read lock."""
+        # The default rollback journal, not WAL, so the file can live on a network filesystem
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def enqueue(self, csv_files, content_hashes, keep_done=False):
+        """Adds files as pending. With keep_done, files already scored with the same content are left done."""
+        with self.transaction() as db:
+            if not keep_done:
+                db.execute("DELETE FROM files")
+            queued = 0
+            for csv_file in csv_files:
+                path = os.path.abspath(csv_file)
+                if keep_done:
+                    row = db.execute("SELECT status, content_hash, economic, social FROM files WHERE path = ?",
+                                     (path,)).fetchone()
+                    if (row and row[0] == "done" and row[1] == content_hashes[csv_file]
+                            and pct.is_valid_score(row[2]) and pct.is_valid_score(row[3])):
+                        continue
+                db.execute("INSERT OR REPLACE INTO files (path, file_name, content_hash) VALUES (?, ?, ?)",
+                           (path, os.path.basename(csv_file), content_hashes[csv_file]))
+                queued += 1
+        return queued
+
+    def claim(self, owner, max_retries):
+        """Leases the next due file to owner; returns (path, attempt) or None.
+
+        Expired leases are claimable again. A file whose lease expired after
+        its last allowed attempt is given up as a transient failure.
+        """
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("UPDATE files SET status = 'done', economic = 'Error', social = 'Error', failure = 'transient', "
+                       "owner = NULL, finished = ? WHERE status = 'leased' AND lease_expires < ? AND attempts > ?",
+                       (datetime.now().isoformat(), now, max_retries))
+            row = db.execute("SELECT path, attempts FROM files WHERE (status = 'pending' AND available_at <= ?) "
+                             "OR (status = 'leased' AND lease_expires < ?) ORDER BY available_at, rowid LIMIT 1",
+                             (now, now)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE files SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                       "WHERE path = ?", (owner, now + self.lease_seconds, row[0]))
+        return row[0], row[1] + 1
+
+    def renew(self, owner, paths):
+        """Extends the leases owner holds on paths."""
+        if not paths:
+            return
+        with self.transaction() as db:
+            db.executemany("UPDATE files SET lease_expires = ? WHERE path = ? AND owner = ? AND status = 'leased'",
+                           [(time.time() + self.lease_seconds, path, owner) for path in paths])
+
+    def release(self, path, delay=0.0, count_attempt=True):
+        """Returns a leased file to the queue, due after delay seconds."""
+        with self.transaction() as db:
+            db.execute("UPDATE files SET status = 'pending', owner = NULL, available_at = ?, "
+                       "attempts = attempts - ? WHERE path = ?", (time.time() + delay, 0 if count_attempt else 1, path))
+
+    def complete(self, path, result):
+        """Records a file's final result."""
+        with self.transaction() as db:
+            db.execute("UPDATE files SET status = 'done', owner = NULL, economic = ?, social = ?, failure = ?, "
+                       "finished = ? WHERE path = ?",
+                       (result["economic"], result["social"], result.get("failure"), datetime.now().isoformat(),
+                        path))
+
+    def counts(self):
+        """Returns {status: number of files}."""
+        with self.transaction(immediate=False) as db:
+            return dict(db.execute("SELECT status, COUNT(*) FROM files GROUP BY status").fetchall())
+
+    def results(self):
+        """Returns {absolute path: {"economic", "social"}} for every finished file."""
+        with self.transaction(immediate=False) as db:
+            rows = db.execute("SELECT path, economic, social FROM files WHERE status = 'done'").fetchall()
+        return {path: {"economic": economic, "social": social} for path, economic, social in rows}
+
+
+class QueueScheduler:
+    """Hands out files claimed from a WorkQueue, with the same interface as main.RetryScheduler.
+
+    Leases of files in flight are renewed by a heartbeat thread every third
+    of the lease time. Transient failures go back to the queue with
+    exponential backoff, so any worker may pick up the retry.
+    """
+
+    def __init__(self, work_queue, owner, max_retries=2, backoff=30, breaker=None, poll_interval=5):
+        self.queue = work_queue
+        self.owner = owner
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or pct.CircuitBreaker()
+        self.poll_interval = poll_interval
+        self.total = sum(work_queue.counts().values())
+        self.attempts = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.heartbeat = threading.Thread(target=self._renew_leases, name="queue-heartbeat", daemon=True)
+        self.heartbeat.start()
+
+    def _renew_leases(self):
+        while not self.stopped.wait(self.queue.lease_seconds / 3):
+            with self.lock:
+                paths = list(self.attempts)
+            try:
+                self.queue.renew(self.owner, paths)
+            except sqlite3.Error as e:
+                logging.warning(f"Failed to renew leases: {e}")
+
+    def pending(self):
+        counts = self.queue.counts()
+        return bool(counts.get("pending") or counts.get("leased"))
+
+    def next_ready(self):
+        if self.breaker.pause_remaining():
+            return None
+        claimed = self.queue.claim(self.owner, self.max_retries)
+        if claimed is None:
+            return None
+        path, attempt = claimed
+        with self.lock:
+            self.attempts[path] = attempt
+        return path
+
+    def put_back(self, csv_file):
+        with self.lock:
+            self.attempts.pop(csv_file, None)
+        self.queue.release(csv_file, count_attempt=False)
+
+    def wait_time(self):
+        return self.breaker.pause_remaining() or self.poll_interval
+
+    def finish(self, csv_file, results_data):
+        """Reports a file's result to the queue; returns True if it is final, False if it was re-queued."""
+        file_name = os.path.basename(csv_file)
+        result = results_data.pop(file_name, {"economic": "Error", "social": "Error", "failure": "permanent"})
+        with self.lock:
+            attempt = self.attempts.pop(csv_file, 1)
+        failure = result.get("failure")
+        if failure == "transient":
+            self.breaker.record(True)
+        elif pct.is_valid_score(result["economic"]):
+            self.breaker.record(False)
+
+        if failure == "transient" and attempt <= self.max_retries:
+            delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.8, 1.2)
+            logging.warning(f"Transient failure on {file_name}; returning it to the queue for retry "
+                            f"{attempt}/{self.max_retries} in {delay:.0f}s.")
+            self.queue.release(csv_file, delay)
+            return False
+        self.queue.complete(csv_file, result)
+        return True
+
+    def close(self):
+        self.stopped.set()
+        self.heartbeat.join()
+
+
+def run_worker(args, output_dir, breaker):
+    """Claims and processes files from the queue until none are left."""
+    work_queue = WorkQueue(args.queue, args.lease_seconds)
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    scheduler = QueueScheduler(work_queue, owner, pct.run_settings["max_retries"], pct.run_settings["retry_backoff"],
+                               breaker)
+    logging.info(f"Worker {owner} joined queue {args.queue} ({scheduler.total} files)")
+    try:
+        # Files come from the queue, not a local list
+        pct.run_browser_stage(args, [], output_dir, {}, scheduler)
+    finally:
+        scheduler.close()
+    logging.info(f"Worker {owner}: queue finished")
+
+
+def run_coordinator(queue_path, csv_files, content_hashes, results_data, on_result, keep_done=False, poll_interval=10):
+    """Enqueues files for the workers, waits until all are done and collects their results."""
+    work_queue = WorkQueue(queue_path)
+    queued = work_queue.enqueue(csv_files, content_hashes, keep_done)
+    logging.info(f"Queued {queued} files in {queue_path}; start workers with --queue {queue_path} --worker")
+
+    last_counts = None
+    while True:
+        counts = work_queue.counts()
+        if counts != last_counts:
+            logging.info(f"Queue: {counts.get('done', 0)} done, {counts.get('leased', 0)} in progress, "
+                         f"{counts.get('pending', 0)} pending")
+            last_counts = counts
+        if not counts.get("pending") and not counts.get("leased"):
+            break
+        time.sleep(poll_interval)
+
+    queued_results = work_queue.results()
+    for csv_file in csv_files:
+        result = queued_results.get(os.path.abspath(csv_file))
+        if result is not None:
+            results_data[os.path.basename(csv_file)] = result
+            on_result(csv_file)